@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+"""
+Serve the backend as an ASGI application.
+
+The calls that only read (GET on /users, /projects and the others that don't
+need authentication) and the ones to /login are answered in the event loop,
+with asynchronous connections to the database (from aiosqlite) and checking
+the passwords in other threads. The rest are passed to the WSGI app of
+backend.py, also in other threads. (With a postgresql database, all the
+calls go to the WSGI app.)
+
+Run it with an ASGI server, like:
+  uvicorn asgi:app
+"""
+
+import io
+import re
+import sys
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from flask_restful.utils import unpack
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import run_wsgi_app
+
+import backend
+from backend import InvalidUsage, output_json
+
+
+# Calls answered asynchronously: (method, path regexp, function that returns
+# the loader of the response given the groups matched in the path).
+ROUTES = [
+    ('GET', r'/users', backend.Users.load),
+    ('GET', r'/users/(\d+)', lambda uid: backend.Users.load(int(uid))),
+    ('GET', r'/projects', backend.Projects.load),
+    ('GET', r'/projects/(\d+)', lambda pid: backend.Projects.load(int(pid))),
+    ('GET', r'/id/(.+)', backend.Id.load),
+    ('GET', r'/search', backend.Search.load),
+    ('GET', r'/projects/(\d+)/candidates',
+     lambda pid: backend.Candidates.load(int(pid))),
+    ('GET', r'/users/(\d+)/suggested-projects',
+     lambda uid: backend.SuggestedProjects.load(int(uid))),
+    ('GET', r'/changes', backend.Changes.load),
+    ('POST', r'/login', backend.Login.load)]
+
+
+class Backend:
+    "ASGI app that answers the calls in ROUTES and passes the rest to wsgi_app"
+
+    def __init__(self, wsgi_app, pool_size=5):
+        self.wsgi_app = wsgi_app
+        self.pool_size = pool_size
+        self.pool = None  # of connections to read, opened by start()
+        self.started = False
+
+    def start(self):
+        "Connect to the database, and prepare our pool if it is sqlite"
+        # Without a sqlite database to read from, the WSGI app does it all.
+        backend.ensure_connected()
+        if backend.storage.name == 'sqlite':
+            self.pool = ReadPool(backend.db_read.url.database, self.pool_size)
+        self.started = True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        elif scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type %r' % scope['type'])
+
+        if not self.started:  # the server didn't use the lifespan protocol
+            self.start()
+
+        environ = make_environ(scope, await read_body(receive))
+
+        loader = self.pool and get_loader(scope['method'], scope['path'])
+        if loader:
+            await self.respond(environ, loader, receive, send)
+        else:
+            loop = asyncio.get_running_loop()
+            status, headers, body = await loop.run_in_executor(None,
+                call_wsgi, self.wsgi_app, environ)
+            await send_start(send, status, headers)
+            await send({'type': 'http.response.body', 'body': body})
+
+    async def respond(self, environ, loader, receive, send):
+        "Send the response given by loader"
+        # It's the same response as the one from the WSGI app: we use the
+        # same request context, representation and error handlers. Its hooks
+        # start the timing of the request, and may already give the response
+        # (like the snapshots of the lists, from their files).
+        app = self.wsgi_app
+        with app.request_context(environ):
+            response, stream = app.preprocess_request(), None
+            if response is not None:
+                response = app.make_response(response)
+            else:
+                response, stream = await self.load_response(loader)
+            response = app.process_response(response)  # adds CORS headers
+
+            app_iter, status, headers = response.get_wsgi_response(environ)
+            if stream:  # its length is not known, and it goes in chunks
+                headers = [(k, v) for k, v in headers
+                           if k.lower() != 'content-length']
+            await send_start(send, status, headers)
+            if stream:
+                await self.send_stream(stream, receive, send)
+            else:
+                try:
+                    await send({'type': 'http.response.body',
+                                'body': b''.join(app_iter)})
+                finally:
+                    if hasattr(app_iter, 'close'):
+                        app_iter.close()  # like the file of a snapshot
+
+    async def load_response(self, loader):
+        "Return the response given by loader, and its Stream (or None)"
+        app = self.wsgi_app
+        async with self.pool.connection() as conn:
+            try:
+                body, code, headers = unpack(await run_loader(conn, loader()))
+                if isinstance(body, backend.Stream):
+                    return app.response_class(status=code, headers=headers,
+                        mimetype=body.mimetype), body
+                return output_json(body, code, headers), None
+            except (InvalidUsage, HTTPException) as e:
+                return app.make_response(app.handle_user_exception(e)), None
+
+    async def send_stream(self, stream, receive, send):
+        "Send the chunks of the stream, until it ends or the client leaves"
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        try:
+            async for chunk in run_stream(self.pool, stream.loader):
+                if disconnected.done():
+                    return
+                await send({'type': 'http.response.body',
+                            'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+    async def lifespan(self, receive, send):
+        "Handle the messages of the ASGI lifespan protocol"
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.pool:
+                    await self.pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+class ReadPool:
+    "Pool of asynchronous read-only connections to a sqlite database"
+
+    def __init__(self, path, size=5, pragmas=None):
+        self.path = path
+        self.size = size
+        self.pragmas = dict(backend.SQLITE_PRAGMAS, **(pragmas or {}),
+                            query_only=1)
+        self.idle = asyncio.Queue()  # open connections not in use
+        self.n_open = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        "Yield a connection from the pool, opening a new one if possible"
+        if self.idle.empty() and self.n_open < self.size:
+            self.n_open += 1
+            try:
+                conn = await self.connect()
+            except:
+                self.n_open -= 1
+                raise
+        else:
+            conn = await self.idle.get()
+
+        try:
+            yield conn
+        finally:
+            self.idle.put_nowait(conn)
+
+    async def connect(self):
+        "Return a new connection to the database, with our pragmas set"
+        conn = await aiosqlite.connect(self.path)
+        for name, value in self.pragmas.items():
+            await conn.execute('pragma %s = %s' % (name, value))
+        return conn
+
+    async def close(self):
+        "Close all the connections that are not in use"
+        while not self.idle.empty():
+            await self.idle.get_nowait().close()
+            self.n_open -= 1
+
+
+# Auxiliary functions.
+
+async def dbget(conn, what, where, args=()):
+    "Return result of the query 'select what from where' as a list of dicts"
+    statement = 'select %s from %s' % (what, where)
+    t0 = time.perf_counter()
+    async with conn.execute(statement, args) as c:
+        rows = await c.fetchall()
+    backend.record_query(statement, time.perf_counter() - t0)
+    keys = what.split(',')
+    return [dict(zip(keys, x)) for x in rows]
+
+
+async def run_loader(conn, loader):
+    "Run the steps that loader yields and return what it returns"
+    # Same as backend.run_loader(), but the queries don't block the event
+    # loop, and the functions (like checking a password) run in other threads.
+    loop = asyncio.get_running_loop()
+    try:
+        step = next(loader)
+        while True:
+            if callable(step):
+                result = await loop.run_in_executor(None, step)
+            else:
+                result = await dbget(conn, *step)
+            step = loader.send(result)
+    except StopIteration as e:
+        return e.value
+
+
+async def run_stream(pool, loader):
+    "Run the steps of the loader of a stream, and yield its chunks"
+    # Each query takes a connection from the pool only while it runs, since
+    # a stream can last long (like the one of /changes, that also yields the
+    # seconds to wait between its queries).
+    loop = asyncio.get_running_loop()
+    result = None
+    while True:
+        try:
+            step = loader.send(result)
+        except StopIteration:
+            return
+        result = None
+        if type(step) == bytes:
+            yield step
+        elif type(step) in [int, float]:
+            await asyncio.sleep(step)
+        elif callable(step):
+            result = await loop.run_in_executor(None, step)
+        else:
+            async with pool.connection() as conn:
+                result = await dbget(conn, *step)
+
+
+async def send_start(send, status, headers):
+    "Send the start of the response, with its status and headers"
+    await send({'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin1'), v.encode('latin1'))
+                            for k, v in headers]})
+
+
+def get_loader(method, path):
+    "Return a function that returns the loader for the call, or None"
+    for route_method, regexp, load in ROUTES:
+        match = re.fullmatch(regexp, path)
+        if method == route_method and match:
+            return lambda: load(*match.groups())
+    return None
+
+
+def call_wsgi(wsgi_app, environ):
+    "Return status, headers and body of the response of the WSGI app"
+    app_iter, status, headers = run_wsgi_app(wsgi_app, environ)
+    try:
+        return status, list(headers.items()), b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+async def wait_disconnect(receive):
+    "Return when the client disconnects"
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def read_body(receive):
+    "Return the full body of the request"
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def make_environ(scope, body):
+    "Return the WSGI environ for the request in the ASGI scope"
+    latin1 = lambda x: x.encode('utf8').decode('latin1')  # as WSGI wants
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': latin1(scope.get('root_path', '')),
+        'PATH_INFO': latin1(scope['path']),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False}
+
+    for name, value in scope['headers']:
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key not in ['CONTENT_TYPE', 'CONTENT_LENGTH']:
+            key = 'HTTP_' + key
+        value = value.decode('latin1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+
+    return environ
+
+
+
+app = Backend(backend.app, backend.settings['pool_size'])
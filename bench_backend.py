@@ -0,0 +1,738 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the performance of backend.py.
+
+Run with "./bench_backend.py [benchmark ...]". It writes the results to
+stdout as json, so they can be saved and compared between versions.
+"""
+
+import sys
+import os
+import re
+import time
+import json
+import random
+import sqlite3
+import tempfile
+import argparse
+import threading
+import subprocess
+import statistics
+import http.client
+from collections import defaultdict
+
+import sqlalchemy
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+import backend
+
+
+MIGRATION_001 = os.path.join(backend.BASE_DIR,
+    'migrations', '001_association_keys.sql')
+
+# Association tables as they were before migration 001 (no keys, no indexes).
+OLD_ASSOCIATION_TABLES = """
+drop table user_profiles;
+create table user_profiles (id_user integer, id_profile integer);
+drop table user_joined_projects;
+create table user_joined_projects (id_user integer, id_project integer);
+drop table user_organized_projects;
+create table user_organized_projects (id_user integer, id_project integer);
+drop table project_requested_profiles;
+create table project_requested_profiles (id_project integer, id_profile integer);
+drop index projects_by_organizer;
+"""
+
+LOOKUPS = {
+    'projects_joined_by_user':
+        'select id_project from user_joined_projects where id_user=?',
+    'participants_by_project':
+        'select id_user from user_joined_projects where id_project=?',
+    'profiles_by_user':
+        'select id_profile from user_profiles where id_user=?',
+    'users_by_profile':
+        'select id_user from user_profiles where id_profile=? limit 10'}
+
+# Hash of the password "abc", which all the synthetic users have (so we don't
+# need to compute a million hashes to create them).
+PASSWORD_HASH = ('pbkdf2:sha256:50000$713rFBmU$1e10a0e9b5fca0b4550b39dffd019'
+                 '31d8cdc64760d5995856e9c775e94e983dd')
+
+AUTH = 'Basic dXNlcjE6YWJj'  # for user1:abc
+
+N_PROFILES = 20
+
+# Script that times the import of the backend and its first response.
+STARTUP_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import backend
+t_import = time.perf_counter() - t0
+backend.app.test_client().get('/users/1')
+print(t_import, time.perf_counter() - t0)
+"""
+
+# Script that starts workers like gunicorn does (by forking, after importing
+# the backend or not) and prints the memory that each one uses after making
+# some requests.
+WORKERS_SCRIPT = """
+import os, gc, sys, json
+preload, n_workers, n_requests = sys.argv[1] == 'preload', *map(int, sys.argv[2:])
+if preload:
+    import backend
+    gc.freeze()  # as in gunicorn.conf.py
+
+pipes = []
+for _ in range(n_workers):
+    r, w = os.pipe()
+    if os.fork() == 0:
+        import backend
+        client = backend.app.test_client()
+        for i in range(n_requests):
+            client.get('/users/%d' % (i + 1))
+        with open('/proc/self/smaps_rollup') as f:
+            memory = {name: int(value.split()[0]) for name, value in
+                      (line.split(':') for line in f if 'kB' in line)}
+        os.write(w, json.dumps(memory).encode('utf8'))
+        os._exit(0)
+    os.close(w)
+    pipes.append(r)
+
+memories = [json.loads(os.read(r, 10000)) for r in pipes]
+for _ in pipes:
+    os.wait()
+print(json.dumps(memories))
+"""
+
+
+# Helper functions.
+
+def timeit(f, *args, repeat=1):
+    "Return the average time in seconds that it takes to run f(*args)"
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        f(*args)
+    return (time.perf_counter() - t0) / repeat
+
+
+def create_db(path):
+    "Create an empty database at the given path with the current schema"
+    backend.migrate(sqlalchemy.create_engine('sqlite:///%s' % path))
+
+
+def create_synthetic_db(path, n_users):
+    "Create a database with n_users users and proportional projects and rows"
+    # Each user has 3 profiles, each project (one per 10 users) has 10
+    # participants and 2 requested profiles.
+    n_projects = max(1, n_users // 10)
+    rnd = random.Random(0)
+    create_db(path)
+
+    conn = sqlite3.connect(path)
+    conn.executemany('insert into profiles values (?, ?)',
+        ((i, 'profile_%d' % i) for i in range(1, N_PROFILES + 1)))
+    conn.executemany('insert into users (id, username, name, password, '
+        'permissions, email, web) values (?, ?, ?, ?, ?, ?, ?)',
+        ((i, 'user%d' % i, 'User %d' % i, PASSWORD_HASH,
+          'rxwrxwrxw' if i == 1 else '---------', 'user%d@ucm.es' % i,
+          'https://example%d.org' % i) for i in range(1, n_users + 1)))
+    conn.executemany('insert into projects (id, organizer, name, summary, '
+        'description, needs) values (?, ?, ?, ?, ?, ?)',
+        ((i, rnd.randint(1, n_users), 'Project %d' % i, 'Summary.',
+          'Description.', 'Needs.') for i in range(1, n_projects + 1)))
+    conn.execute('insert into user_organized_projects '
+        'select organizer, id from projects')
+    conn.executemany('insert into user_profiles values (?, ?)',
+        ((u, p) for u in range(1, n_users + 1)
+         for p in rnd.sample(range(1, N_PROFILES + 1), 3)))
+    conn.executemany('insert into user_joined_projects values (?, ?)',
+        ((u, p) for p in range(1, n_projects + 1)
+         for u in rnd.sample(range(1, n_users + 1), min(10, n_users))))
+    conn.executemany('insert into project_requested_profiles values (?, ?)',
+        ((p, x) for p in range(1, n_projects + 1)
+         for x in rnd.sample(range(1, N_PROFILES + 1), 2)))
+    conn.commit()
+    conn.close()
+
+    return n_projects
+
+
+def percentile(xs, q):
+    "Return the q-quantile (0 <= q <= 1) of the sorted list xs"
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def summarize(records, seconds):
+    "Return the statistics of the records (endpoint, latency, queries, status)"
+    def stats(rows):
+        latencies = sorted(x[1] for x in rows)
+        return {'requests': len(rows),
+                'errors': sum(1 for x in rows if x[3] >= 400),
+                'p50_ms': 1000 * percentile(latencies, 0.5),
+                'p99_ms': 1000 * percentile(latencies, 0.99),
+                'queries_per_request': sum(x[2] for x in rows) / len(rows)}
+
+    by_endpoint = defaultdict(list)
+    for row in records:
+        by_endpoint[row[0]].append(row)
+
+    return dict(stats(records),
+                seconds=seconds,
+                requests_per_s=len(records) / seconds,
+                endpoints={k: stats(v) for k, v in sorted(by_endpoint.items())})
+
+
+# Clients that make the requests of the workload and record them.
+
+class Client:
+    "Base of the clients, that keeps the records of the requests made"
+
+    def __init__(self):
+        self.records = []  # (endpoint, latency, queries, status)
+
+    def call(self, endpoint, method, path, data=None):
+        "Make the request, record it and return the json response"
+        t0 = time.perf_counter()
+        status, headers, body = self.request(method, path, data)
+        latency = time.perf_counter() - t0
+        # The backend tells the number of queries in the Server-Timing header.
+        match = re.search(r'"(\d+) queries"', headers.get('Server-Timing', ''))
+        queries = int(match.group(1)) if match else 0
+        self.records.append((endpoint, latency, queries, status))
+        return json.loads(body) if body else None
+
+
+class InProcessClient(Client):
+    "Client that calls the app directly, with flask's test client"
+
+    def __init__(self, app):
+        super().__init__()
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        res = self.client.open(path, method=method, json=data,
+                               headers={'Authorization': AUTH})
+        return res.status_code, res.headers, res.data
+
+
+class HttpClient(Client):
+    "Client that makes http requests to a server"
+
+    def __init__(self, host, port):
+        super().__init__()
+        self.host, self.port = host, port
+
+    def request(self, method, path, data=None):
+        conn = http.client.HTTPConnection(self.host, self.port)
+        try:
+            conn.request(method, path,
+                body=None if data is None else json.dumps(data),
+                headers={'Authorization': AUTH,
+                         'Content-Type': 'application/json'})
+            res = conn.getresponse()
+            return res.status, res.headers, res.read()
+        finally:
+            conn.close()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    "Handler for the http server that doesn't log every request"
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+# The workload: scenarios like the ones in test_backend.py, with the weight
+# of each one (how often it is chosen). Each scenario is a function that
+# makes its requests with client, for random users and projects.
+
+def get_user(client, rnd, n_users, n_projects):
+    client.call('GET /users/<id>', 'GET', '/users/%d' % rnd.randint(1, n_users))
+
+
+def get_project(client, rnd, n_users, n_projects):
+    client.call('GET /projects/<id>', 'GET',
+        '/projects/%d' % rnd.randint(1, n_projects))
+
+
+def list_users(client, rnd, n_users, n_projects):
+    client.call('GET /users?limit', 'GET',
+        '/users?limit=50&after=%d' % rnd.randint(0, n_users))
+
+
+def list_projects(client, rnd, n_users, n_projects):
+    client.call('GET /projects?limit', 'GET',
+        '/projects?limit=50&after=%d' % rnd.randint(0, n_projects))
+
+
+def filter_projects(client, rnd, n_users, n_projects):
+    client.call('GET /projects?profile', 'GET',
+        '/projects?limit=50&profile=profile_%d' % rnd.randint(1, N_PROFILES))
+
+
+def search(client, rnd, n_users, n_projects):
+    client.call('GET /search', 'GET', '/search?q=project+%d' %
+        rnd.randint(1, n_projects))
+
+
+def get_candidates(client, rnd, n_users, n_projects):
+    client.call('GET /projects/<id>/candidates', 'GET',
+        '/projects/%d/candidates' % rnd.randint(1, n_projects))
+
+
+def get_suggested_projects(client, rnd, n_users, n_projects):
+    client.call('GET /users/<id>/suggested-projects', 'GET',
+        '/users/%d/suggested-projects' % rnd.randint(1, n_users))
+
+
+def change_user(client, rnd, n_users, n_projects):
+    client.call('PUT /users/<id>', 'PUT', '/users/%d' % rnd.randint(1, n_users),
+        {'name': 'User %d' % rnd.randint(1, 1000)})
+
+
+def join_and_leave_project(client, rnd, n_users, n_projects):
+    pid, uid = rnd.randint(1, n_projects), rnd.randint(1, n_users)
+    client.call('PUT /projects/<id>', 'PUT', '/projects/%d' % pid,
+        {'addParticipants': [uid]})
+    client.call('PUT /projects/<id>', 'PUT', '/projects/%d' % pid,
+        {'delParticipants': [uid]})
+
+
+def add_and_delete_project(client, rnd, n_users, n_projects):
+    res = client.call('POST /projects', 'POST', '/projects',
+        {'name': 'Bench %d' % rnd.getrandbits(64), 'summary': 'Summary.',
+         'needs': 'Needs.', 'description': 'Description.',
+         'addProfiles': ['profile_%d' % rnd.randint(1, N_PROFILES)]})
+    if res and 'id' in res:
+        client.call('DELETE /projects/<id>', 'DELETE', '/projects/%d' % res['id'])
+
+
+WORKLOAD = [
+    (30, get_user),
+    (30, get_project),
+    (8, list_users),
+    (8, list_projects),
+    (9, filter_projects),
+    (5, search),
+    (3, get_candidates),
+    (3, get_suggested_projects),
+    (7, change_user),
+    (5, join_and_leave_project),
+    (3, add_and_delete_project)]
+
+
+def run_workload(clients, requests, n_users, n_projects):
+    "Run the workload with the clients in parallel, and return the records"
+    weights, scenarios = zip(*WORKLOAD)
+
+    def run(client, seed):
+        rnd = random.Random(seed)
+        while len(client.records) < requests // len(clients):
+            scenario = rnd.choices(scenarios, weights)[0]
+            scenario(client, rnd, n_users, n_projects)
+
+    threads = [threading.Thread(target=run, args=(client, i))
+               for i, client in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return [x for client in clients for x in client.records]
+
+
+# The benchmarks.
+
+def bench_association_lookups(rows=10**6, lookups=20):
+    "Time lookups in the association tables before and after migration 001"
+    n_users = max(1, rows // 10)  # so each user joins ~10 projects
+    n_projects = max(1, rows // 100)  # and each project has ~100 participants
+    n_profiles = 50
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        create_db(path)
+
+        conn = sqlite3.connect(path)
+        conn.executescript(OLD_ASSOCIATION_TABLES)
+        rnd = random.Random(0)
+        conn.executemany('insert into user_joined_projects values (?, ?)',
+            ((rnd.randint(1, n_users), rnd.randint(1, n_projects))
+             for _ in range(rows)))
+        conn.executemany('insert into user_profiles values (?, ?)',
+            ((rnd.randint(1, n_users), rnd.randint(1, n_profiles))
+             for _ in range(rows)))
+        conn.commit()
+
+        def run_lookups():
+            results = {}
+            for name, sql in LOOKUPS.items():
+                top = n_profiles if 'by_profile' in name else n_users
+                ids = [rnd.randint(1, top) for _ in range(lookups)]
+                t = timeit(lambda: [conn.execute(sql, (x,)).fetchall()
+                                    for x in ids])
+                results[name] = 1000 * t / lookups  # in ms per lookup
+            return results
+
+        before = run_lookups()
+
+        with open(MIGRATION_001) as f:
+            t_migration = timeit(conn.executescript, f.read())
+
+        after = run_lookups()
+        conn.close()
+
+    return {'rows': rows,
+            'migration_s': t_migration,
+            'lookup_ms_before': before,
+            'lookup_ms_after': after}
+
+
+def bench_workload(sizes=(10**4,), requests=1000, clients=1,
+                   modes=('inprocess', 'http')):
+    "Measure latency, throughput and queries of a mixed read/write workload"
+    results = {}
+    for n_users in sizes:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.db')
+            t0 = time.perf_counter()
+            n_projects = create_synthetic_db(path, n_users)
+            results[n_users] = {'create_db_s': time.perf_counter() - t0}
+
+            app = backend.initialize(db_name=path)
+
+            for mode in modes:
+                if mode == 'inprocess':
+                    server = None
+                    make_client = lambda: InProcessClient(app)
+                else:
+                    server = make_server('localhost', 0, app, threaded=True,
+                                         request_handler=QuietRequestHandler)
+                    threading.Thread(target=server.serve_forever).start()
+                    make_client = lambda: HttpClient('localhost',
+                                                     server.server_port)
+
+                t0 = time.perf_counter()
+                records = run_workload([make_client() for _ in range(clients)],
+                                       requests, n_users, n_projects)
+                results[n_users][mode] = summarize(records,
+                                                   time.perf_counter() - t0)
+
+                if server:
+                    server.shutdown()
+
+            backend.db.dispose()
+            backend.db_read.dispose()
+
+    return results
+
+
+def bench_tokens(repeat=10000):
+    "Time the creation and verification of the tokens for bearer auth"
+    signer = backend.TokenSigner([os.urandom(32), os.urandom(32)])
+    token = signer.dumps(1, 'rxwrxwrxw')
+    results = {
+        'create_us': 1e6 * timeit(signer.dumps, 1, 'rxwrxwrxw', repeat=repeat),
+        'verify_us': 1e6 * timeit(signer.loads, token, repeat=repeat)}
+
+    try:  # compare with the tokens we used before, if still available
+        from itsdangerous import TimedJSONWebSignatureSerializer
+        serializer = TimedJSONWebSignatureSerializer(os.urandom(256), 3600)
+        old_token = serializer.dumps(1)
+        results['old_create_us'] = 1e6 * timeit(serializer.dumps, 1,
+                                                 repeat=repeat)
+        results['old_verify_us'] = 1e6 * timeit(serializer.loads, old_token,
+                                                 repeat=repeat)
+    except ImportError:
+        pass
+
+    return results
+
+
+def bench_encoding(n_users=10**4, repeat=100):
+    "Measure the cpu time and size of list responses with each encoding"
+    encoders = {'json': backend.encode_stdlib}
+    if backend.orjson:
+        encoders['orjson'] = backend.encode_orjson
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        create_synthetic_db(path, n_users)
+
+        for name, encoder in encoders.items():
+            app = backend.initialize(db_name=path, encoder=encoder)
+            client = app.test_client()
+            for compression in ['none'] + backend.ENCODINGS:
+                headers = {'Accept-Encoding': compression}
+                for table in ['users', 'projects']:
+                    path_ = '/%s?limit=100' % table
+                    t0 = time.process_time()
+                    for _ in range(repeat):
+                        res = client.get(path_, headers=headers)
+                    cpu_ms = 1000 * (time.process_time() - t0) / repeat
+                    results.setdefault(path_, {})[name + '+' + compression] = {
+                        'cpu_ms': cpu_ms, 'bytes': len(res.data)}
+
+            backend.db.dispose()
+            backend.db_read.dispose()
+
+    for variants in results.values():  # compared to the json module, as is
+        base = variants['json+none']['cpu_ms']
+        for x in variants.values():
+            x['cpu_ms_saved'] = base - x['cpu_ms']
+
+    return results
+
+
+def bench_startup(n_workers=4, requests=100, repeat=5):
+    "Measure the cold start of the backend and the memory of its workers"
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        create_synthetic_db(path, max(requests, 1000))
+        env = dict(os.environ, SMART_DB=path, PYTHONPATH=backend.BASE_DIR)
+        run = lambda *args: subprocess.run([sys.executable, '-c', *args],
+            env=env, cwd=tmpdir, check=True, stdout=subprocess.PIPE,
+            universal_newlines=True).stdout
+
+        times = [[float(x) for x in run(STARTUP_SCRIPT).split()]
+                 for _ in range(repeat)]
+        results['import_s'] = statistics.median(x[0] for x in times)
+        results['first_response_s'] = statistics.median(x[1] for x in times)
+
+        if os.path.exists('/proc/self/smaps_rollup'):  # linux only
+            for mode in ['preload', 'no_preload']:
+                memories = json.loads(run(WORKERS_SCRIPT, mode,
+                                          str(n_workers), str(requests)))
+                results[mode] = {  # in kB, per worker
+                    'rss': statistics.mean(x['Rss'] for x in memories),
+                    'pss': statistics.mean(x['Pss'] for x in memories),
+                    'private': statistics.mean(x['Private_Clean'] +
+                        x['Private_Dirty'] for x in memories)}
+
+    return results
+
+
+def bench_documents(n_users=10**4, repeat=1000):
+    "Time the reads of users and projects, built from the tables or as json"
+    # Without the cache, so every read goes to the database.
+    calls = {
+        'get_user': lambda rnd: ('GET', '/users/%d' % rnd.randint(1, n_users)),
+        'get_project': lambda rnd: ('GET', '/projects/%d' %
+                                    rnd.randint(1, n_projects)),
+        'list_projects': lambda rnd: ('GET', '/projects?limit=20&after=%d' %
+                                      rnd.randint(0, n_projects)),
+        'sort_projects': lambda rnd: ('GET', '/projects?limit=20&sort='
+                                      'participants'),
+        'change_user': lambda rnd: ('PUT', '/users/1')}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        n_projects = create_synthetic_db(path, n_users)  # without documents
+        app = backend.initialize(db_name=path, cache_size=0)
+        client = app.test_client()
+
+        def run_calls():
+            rnd = random.Random(0)
+            times = {}
+            for name, call in calls.items():
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    method, path_ = call(rnd)
+                    client.open(path_, method=method, json={'web': 'x'},
+                                headers={'Authorization': AUTH})
+                times[name] = 1000 * (time.perf_counter() - t0) / repeat
+            return times  # in ms per call
+
+        results['built_ms'] = run_calls()
+        results['rebuild_s'] = timeit(backend.rebuild_documents)
+        results['stored_ms'] = run_calls()
+
+        backend.db.dispose()
+        backend.db_read.dispose()
+
+    return results
+
+
+def bench_login_flood(n_attackers=8, requests=200):
+    "Measure the latency of normal requests during a flood of bad logins"
+    # The attackers try wrong passwords for random users, all from the same
+    # ip, while a client gets users. With and without limiting the checks,
+    # and without attackers to compare.
+    unlimited = {'client_password_checks': None,
+                 'account_password_checks': None,
+                 'max_hashing': 1000, 'max_hashing_queue': 0}
+    configs = {'no_flood': ({}, 0),
+               'limited': ({}, n_attackers),
+               'unlimited': (unlimited, n_attackers)}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        n_users = 1000
+        create_synthetic_db(path, n_users)
+
+        for name, (config, n) in configs.items():
+            app = backend.initialize(db_name=path, **config)
+            server = make_server('localhost', 0, app, threaded=True,
+                                 request_handler=QuietRequestHandler)
+            threading.Thread(target=server.serve_forever).start()
+            new_client = lambda: HttpClient('localhost', server.server_port)
+
+            stop = threading.Event()
+            def attack(client, seed):
+                rnd = random.Random(seed)
+                while not stop.is_set():
+                    client.call('login', 'POST', '/login', {
+                        'usernameOrEmail': 'user%d' % rnd.randint(1, n_users),
+                        'password': 'wrong'})
+
+            attackers = [new_client() for _ in range(n)]
+            threads = [threading.Thread(target=attack, args=(client, i))
+                       for i, client in enumerate(attackers)]
+            for t in threads:
+                t.start()
+
+            reader = new_client()
+            rnd = random.Random(0)
+            t0 = time.perf_counter()
+            for _ in range(requests):
+                reader.call('get_user', 'GET',
+                            '/users/%d' % rnd.randint(1, n_users))
+            seconds = time.perf_counter() - t0
+
+            stop.set()
+            for t in threads:
+                t.join()
+            server.shutdown()
+
+            logins = [x for client in attackers for x in client.records]
+            results[name] = {
+                'get_user': summarize(reader.records, seconds),
+                'logins_by_status': {str(k): sum(1 for x in logins
+                                                 if x[3] == k)
+                                     for k in sorted({x[3] for x in logins})}}
+            del results[name]['get_user']['endpoints']
+
+            backend.db.dispose()
+            backend.db_read.dispose()
+
+    return results
+
+
+def bench_snapshots(n_users=10**4, repeat=100):
+    "Time the anonymous lists from the database and from the snapshots"
+    # And how long it takes to have a new snapshot after changing a user,
+    # which only writes again the page where it is.
+    calls = {
+        'list_users': lambda rnd: '/users',
+        'page_users': lambda rnd: '/users?limit=100&after=%d' %
+                                  (100 * rnd.randint(0, n_users // 100 - 1))}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.db')
+        create_synthetic_db(path, n_users)
+        backend.initialize(db_name=path)
+        backend.rebuild_documents()
+
+        snapshot_dir = os.path.join(tmpdir, 'snapshots')
+        for name, config in [('database', {}),
+                             ('snapshots', {'snapshot_dir': snapshot_dir})]:
+            client = backend.initialize(db_name=path, **config).test_client()
+            if config:
+                results['first_snapshot_s'] = timeit(wait_snapshot, 'users')
+
+            rnd = random.Random(0)
+            results[name + '_ms'] = times = {}
+            for call_name, call in calls.items():
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    client.get(call(rnd)).get_data()  # all of it
+                times[call_name] = 1000 * (time.perf_counter() - t0) / repeat
+
+            if config:
+                client.put('/users/1', json={'web': 'x'},
+                           headers={'Authorization': AUTH})
+                results['new_snapshot_s'] = timeit(wait_snapshot, 'users')
+                backend.snapshots.close()
+
+            backend.db.dispose()
+            backend.db_read.dispose()
+
+    return results
+
+
+def wait_snapshot(table):
+    "Wait until the snapshot of the table is of its latest version"
+    while True:
+        current = backend.snapshots.read_version(table, 'current')
+        latest = backend.snapshots.read_version(table, 'latest')
+        if current is not None and latest is not None and current >= latest:
+            return
+        time.sleep(0.001)
+
+
+BENCHMARKS = {
+    'association_lookups': bench_association_lookups,
+    'workload': bench_workload,
+    'tokens': bench_tokens,
+    'encoding': bench_encoding,
+    'startup': bench_startup,
+    'documents': bench_documents,
+    'login_flood': bench_login_flood,
+    'snapshots': bench_snapshots}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmarks', nargs='*',
+        help='benchmarks to run (default: all): %s' % ', '.join(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=10**6,
+        help='number of rows in the association tables (association_lookups)')
+    parser.add_argument('--users', type=int, nargs='+', default=[10**4],
+        help='number of users of each synthetic database (workload, encoding, '
+             'documents, snapshots)')
+    parser.add_argument('--requests', type=int, default=1000,
+        help='number of requests to make in each mode (workload, '
+             'login_flood)')
+    parser.add_argument('--clients', type=int, default=1,
+        help='number of clients making requests at the same time (workload)')
+    parser.add_argument('--workers', type=int, default=4,
+        help='number of worker processes to start (startup)')
+    parser.add_argument('--attackers', type=int, default=8,
+        help='number of clients trying bad logins at once (login_flood)')
+    parser.add_argument('--modes', nargs='+', choices=['inprocess', 'http'],
+        default=['inprocess', 'http'],
+        help='call the app directly and/or through http (workload)')
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %r' % name)
+
+    options = {  # arguments for each benchmark
+        'association_lookups': {'rows': args.rows},
+        'workload': {'sizes': args.users, 'requests': args.requests,
+                     'clients': args.clients, 'modes': args.modes},
+        'tokens': {},
+        'encoding': {'n_users': args.users[0]},
+        'startup': {'n_workers': args.workers},
+        'documents': {'n_users': args.users[0]},
+        'login_flood': {'n_attackers': args.attackers,
+                        'requests': args.requests},
+        'snapshots': {'n_users': args.users[0]}}
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        results[name] = BENCHMARKS[name](**options[name])
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,14 @@ create table users (
     password text not null,
     permissions text,
     email text not null unique,
-    web text);
+    web text,
+    version integer not null default 0,  -- see the clock table
+    updated_at real,
+    document text,  -- as json (see write_documents() in backend.py)
+    n_projects_created integer not null default 0,
+    n_projects_joined integer not null default 0);
+create index users_by_projects_created on users (n_projects_created desc, id);
+create index users_by_projects_joined on users (n_projects_joined desc, id);
 
 drop table if exists projects;
 create table projects (
@@ -21,7 +28,13 @@ create table projects (
     url text,
     img_bg text,
     img1 text,
-    img2 text);
+    img2 text,
+    version integer not null default 0,  -- see the clock table
+    updated_at real,
+    document text,  -- as json (see write_documents() in backend.py)
+    n_participants integer not null default 0);
+create index projects_by_organizer on projects (organizer);
+create index projects_by_participants on projects (n_participants desc, id);
 
 drop table if exists profiles;
 create table profiles (
@@ -30,20 +43,103 @@ create table profiles (
 
 drop table if exists user_profiles;
 create table user_profiles (
-    id_user integer,
-    id_profile integer);
+    id_user integer not null,
+    id_profile integer not null,
+    primary key (id_user, id_profile));
+create index user_profiles_by_profile
+    on user_profiles (id_profile, id_user);
 
 drop table if exists user_organized_projects;
 create table user_organized_projects (
-    id_user integer,
-    id_project integer);
+    id_user integer not null,
+    id_project integer not null,
+    primary key (id_user, id_project));
+create index user_organized_projects_by_project
+    on user_organized_projects (id_project, id_user);
 
 drop table if exists user_joined_projects;
 create table user_joined_projects (
-    id_user integer,
-    id_project integer);
+    id_user integer not null,
+    id_project integer not null,
+    primary key (id_user, id_project));
+create index user_joined_projects_by_project
+    on user_joined_projects (id_project, id_user);
 
 drop table if exists project_requested_profiles;
 create table project_requested_profiles (
-    id_project integer,
-    id_profile integer);
+    id_project integer not null,
+    id_profile integer not null,
+    primary key (id_project, id_profile));
+create index project_requested_profiles_by_profile
+    on project_requested_profiles (id_profile, id_project);
+
+-- Full-text search indexes of users and projects (see /search).
+drop table if exists users_search;
+drop table if exists projects_search;
+
+create virtual table users_search using fts5(
+    name, username, web,
+    content='users', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2');
+
+create trigger users_search_insert after insert on users begin
+    insert into users_search (rowid, name, username, web)
+        values (new.id, new.name, new.username, new.web);
+end;
+create trigger users_search_delete after delete on users begin
+    insert into users_search (users_search, rowid, name, username, web)
+        values ('delete', old.id, old.name, old.username, old.web);
+end;
+create trigger users_search_update
+    after update of name, username, web on users begin
+    insert into users_search (users_search, rowid, name, username, web)
+        values ('delete', old.id, old.name, old.username, old.web);
+    insert into users_search (rowid, name, username, web)
+        values (new.id, new.name, new.username, new.web);
+end;
+
+create virtual table projects_search using fts5(
+    name, summary, description, needs,
+    content='projects', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2');
+
+create trigger projects_search_insert after insert on projects begin
+    insert into projects_search (rowid, name, summary, description, needs)
+        values (new.id, new.name, new.summary, new.description, new.needs);
+end;
+create trigger projects_search_delete after delete on projects begin
+    insert into projects_search
+        (projects_search, rowid, name, summary, description, needs)
+        values ('delete', old.id, old.name, old.summary, old.description,
+                old.needs);
+end;
+create trigger projects_search_update
+    after update of name, summary, description, needs on projects begin
+    insert into projects_search
+        (projects_search, rowid, name, summary, description, needs)
+        values ('delete', old.id, old.name, old.summary, old.description,
+                old.needs);
+    insert into projects_search (rowid, name, summary, description, needs)
+        values (new.id, new.name, new.summary, new.description, new.needs);
+end;
+
+-- Global version, which advances with each transaction that changes users or
+-- projects. The rows changed get its value (and time) as their version.
+drop table if exists clock;
+create table clock (
+    version integer not null,
+    updated_at real);
+insert into clock values (0, null);
+
+-- Rows (users or projects) changed in each version of the clock, to send the
+-- changes to the clients that follow them (see /changes).
+drop table if exists changes;
+create table changes (
+    version integer not null,
+    table_name text not null,
+    row_id integer not null,
+    primary key (version, table_name, row_id));
+
+-- Version of the schema (see the migrations directory). Increase it when
+-- adding a new migration, and put the same changes in this file.
+pragma user_version = 6;
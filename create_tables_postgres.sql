@@ -0,0 +1,106 @@
+-- Run this file to (re)create all the tables needed for the backend in a
+-- postgresql database. It is the same schema as in create_tables.sql.
+
+drop table if exists users, projects, profiles, user_profiles,
+    user_organized_projects, user_joined_projects, project_requested_profiles,
+    clock, changes cascade;
+
+-- The full-text search of users and projects (see /search) uses their
+-- search_vector columns, with the words of each field weighted by relevance.
+create table users (
+    id serial primary key,
+    username text unique,
+    name text not null,
+    password text not null,
+    permissions text,
+    email text not null unique,
+    web text,
+    version integer not null default 0,  -- see the clock table
+    updated_at double precision,
+    document text,  -- as json (see write_documents() in backend.py)
+    n_projects_created integer not null default 0,
+    n_projects_joined integer not null default 0,
+    search_vector tsvector generated always as (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(username, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(web, '')), 'D')) stored);
+create index users_search on users using gin (search_vector);
+create index users_by_projects_created on users (n_projects_created desc, id);
+create index users_by_projects_joined on users (n_projects_joined desc, id);
+
+create table projects (
+    id serial primary key,
+    organizer integer not null,
+    name text unique not null,
+    summary text,
+    description text,
+    needs text,
+    url text,
+    img_bg text,
+    img1 text,
+    img2 text,
+    version integer not null default 0,  -- see the clock table
+    updated_at double precision,
+    document text,  -- as json (see write_documents() in backend.py)
+    n_participants integer not null default 0,
+    search_vector tsvector generated always as (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(summary, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'D') ||
+        setweight(to_tsvector('simple', coalesce(needs, '')), 'D')) stored);
+create index projects_by_organizer on projects (organizer);
+create index projects_search on projects using gin (search_vector);
+create index projects_by_participants on projects (n_participants desc, id);
+
+create table profiles (
+    id serial primary key,
+    profile_name text not null unique);
+
+-- The association tables have a rowid column (last, so inserts can leave it
+-- out) to keep the order in which the rows were added, as sqlite does.
+create table user_profiles (
+    id_user integer not null,
+    id_profile integer not null,
+    rowid bigserial,
+    primary key (id_user, id_profile));
+create index user_profiles_by_profile
+    on user_profiles (id_profile, id_user);
+
+create table user_organized_projects (
+    id_user integer not null,
+    id_project integer not null,
+    rowid bigserial,
+    primary key (id_user, id_project));
+create index user_organized_projects_by_project
+    on user_organized_projects (id_project, id_user);
+
+create table user_joined_projects (
+    id_user integer not null,
+    id_project integer not null,
+    rowid bigserial,
+    primary key (id_user, id_project));
+create index user_joined_projects_by_project
+    on user_joined_projects (id_project, id_user);
+
+create table project_requested_profiles (
+    id_project integer not null,
+    id_profile integer not null,
+    rowid bigserial,
+    primary key (id_project, id_profile));
+create index project_requested_profiles_by_profile
+    on project_requested_profiles (id_profile, id_project);
+
+-- Global version, which advances with each transaction that changes users or
+-- projects. The rows changed get its value (and time) as their version.
+create table clock (
+    version integer not null,
+    updated_at double precision);
+insert into clock values (0, null);
+
+-- Rows (users or projects) changed in each version of the clock, to send the
+-- changes to the clients that follow them (see /changes).
+create table changes (
+    version integer not null,
+    table_name text not null,
+    row_id integer not null,
+    primary key (version, table_name, row_id));
@@ -0,0 +1,58 @@
+"""
+Settings to serve the backend with gunicorn, which reads them from this file
+when started in this directory, like:
+  gunicorn backend:app
+
+The app is loaded once, before forking the workers, so they all share the
+memory of its code. Then each worker opens its own connections to the
+database (see backend.create_app()).
+
+Each worker serves several requests at once in threads, since the streams
+and long polls of /changes keep one busy while they wait, and its timeout is
+longer than a stream of events lasts (backend.CHANGES_MAX_TIME), so gunicorn
+doesn't kill the workers that are sending them.
+
+The workers share the cache of users and projects and the limits of the
+password checks, in files of a new directory (in memory, if /dev/shm exists)
+unless the SMART_CACHE and SMART_LIMITS environment variables give others.
+"""
+
+import os
+import gc
+import shutil
+import tempfile
+import multiprocessing
+
+bind = '127.0.0.1:5000'
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 8  # fewer than the connections of a pool (pool_size + max_overflow)
+timeout = 330  # s, more than backend.CHANGES_MAX_TIME
+preload_app = True
+
+shared_dir = None  # for the files shared by the workers, removed at exit
+if not (os.environ.get('SMART_CACHE') and os.environ.get('SMART_LIMITS')):
+    shared_dir = tempfile.mkdtemp(prefix='smart-',
+        dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.environ.setdefault('SMART_CACHE', os.path.join(shared_dir, 'cache.db'))
+    os.environ.setdefault('SMART_LIMITS', os.path.join(shared_dir,
+                                                       'limits.db'))
+
+
+def on_starting(server):
+    "Create the tables or apply pending migrations, once for all the workers"
+    import backend
+    backend.migrate_database()
+    gc.freeze()  # so collecting garbage in the workers doesn't copy the app
+
+
+def post_fork(server, worker):
+    "Connect the new worker to the database"
+    import backend
+    backend.connect()
+
+
+def on_exit(server):
+    "Remove the files shared by the workers"
+    if shared_dir:
+        shutil.rmtree(shared_dir, ignore_errors=True)
@@ -0,0 +1,65 @@
+-- Add primary keys to the association tables (dropping repeated rows) and
+-- indexes to look them up from either side.
+
+create table user_profiles_new (
+    id_user integer not null,
+    id_profile integer not null,
+    primary key (id_user, id_profile));
+insert into user_profiles_new
+    select id_user, id_profile from user_profiles
+    where rowid in (select min(rowid) from user_profiles
+                    where id_user is not null and id_profile is not null
+                    group by id_user, id_profile)
+    order by rowid;
+drop table user_profiles;
+alter table user_profiles_new rename to user_profiles;
+
+create table user_organized_projects_new (
+    id_user integer not null,
+    id_project integer not null,
+    primary key (id_user, id_project));
+insert into user_organized_projects_new
+    select id_user, id_project from user_organized_projects
+    where rowid in (select min(rowid) from user_organized_projects
+                    where id_user is not null and id_project is not null
+                    group by id_user, id_project)
+    order by rowid;
+drop table user_organized_projects;
+alter table user_organized_projects_new rename to user_organized_projects;
+
+create table user_joined_projects_new (
+    id_user integer not null,
+    id_project integer not null,
+    primary key (id_user, id_project));
+insert into user_joined_projects_new
+    select id_user, id_project from user_joined_projects
+    where rowid in (select min(rowid) from user_joined_projects
+                    where id_user is not null and id_project is not null
+                    group by id_user, id_project)
+    order by rowid;
+drop table user_joined_projects;
+alter table user_joined_projects_new rename to user_joined_projects;
+
+create table project_requested_profiles_new (
+    id_project integer not null,
+    id_profile integer not null,
+    primary key (id_project, id_profile));
+insert into project_requested_profiles_new
+    select id_project, id_profile from project_requested_profiles
+    where rowid in (select min(rowid) from project_requested_profiles
+                    where id_project is not null and id_profile is not null
+                    group by id_project, id_profile)
+    order by rowid;
+drop table project_requested_profiles;
+alter table project_requested_profiles_new rename to project_requested_profiles;
+
+create index user_profiles_by_profile
+    on user_profiles (id_profile, id_user);
+create index user_organized_projects_by_project
+    on user_organized_projects (id_project, id_user);
+create index user_joined_projects_by_project
+    on user_joined_projects (id_project, id_user);
+create index project_requested_profiles_by_profile
+    on project_requested_profiles (id_profile, id_project);
+create index projects_by_organizer
+    on projects (organizer);
@@ -0,0 +1,13 @@
+-- Keep a version and modification time in users and projects, taken from a
+-- global clock that advances with every transaction that changes them.
+
+alter table users add column version integer not null default 0;
+alter table users add column updated_at real;
+
+alter table projects add column version integer not null default 0;
+alter table projects add column updated_at real;
+
+create table clock (
+    version integer not null,
+    updated_at real);
+insert into clock values (0, null);
@@ -0,0 +1,51 @@
+-- Full-text search indexes (fts5) of users and projects, used by /search.
+-- They only keep the index (the contents are in the tables), and triggers
+-- keep them in sync with every change of the indexed columns.
+
+create virtual table users_search using fts5(
+    name, username, web,
+    content='users', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2');
+insert into users_search (users_search) values ('rebuild');
+
+create trigger users_search_insert after insert on users begin
+    insert into users_search (rowid, name, username, web)
+        values (new.id, new.name, new.username, new.web);
+end;
+create trigger users_search_delete after delete on users begin
+    insert into users_search (users_search, rowid, name, username, web)
+        values ('delete', old.id, old.name, old.username, old.web);
+end;
+create trigger users_search_update
+    after update of name, username, web on users begin
+    insert into users_search (users_search, rowid, name, username, web)
+        values ('delete', old.id, old.name, old.username, old.web);
+    insert into users_search (rowid, name, username, web)
+        values (new.id, new.name, new.username, new.web);
+end;
+
+create virtual table projects_search using fts5(
+    name, summary, description, needs,
+    content='projects', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2');
+insert into projects_search (projects_search) values ('rebuild');
+
+create trigger projects_search_insert after insert on projects begin
+    insert into projects_search (rowid, name, summary, description, needs)
+        values (new.id, new.name, new.summary, new.description, new.needs);
+end;
+create trigger projects_search_delete after delete on projects begin
+    insert into projects_search
+        (projects_search, rowid, name, summary, description, needs)
+        values ('delete', old.id, old.name, old.summary, old.description,
+                old.needs);
+end;
+create trigger projects_search_update
+    after update of name, summary, description, needs on projects begin
+    insert into projects_search
+        (projects_search, rowid, name, summary, description, needs)
+        values ('delete', old.id, old.name, old.summary, old.description,
+                old.needs);
+    insert into projects_search (rowid, name, summary, description, needs)
+        values (new.id, new.name, new.summary, new.description, new.needs);
+end;
@@ -0,0 +1,8 @@
+-- Keep a log of the rows (users or projects) changed in each version of the
+-- clock, to send the changes to the clients that follow them (see /changes).
+
+create table changes (
+    version integer not null,
+    table_name text not null,
+    row_id integer not null,
+    primary key (version, table_name, row_id));
@@ -0,0 +1,23 @@
+-- Keep in users and projects their documents (as json) and the counters of
+-- their relations. The counters are computed here, but not the documents:
+-- until "python backend.py rebuild" writes them, they are built from the
+-- other tables on every read (and written only when their rows change).
+
+alter table users add column document text;
+alter table users add column n_projects_created integer not null default 0;
+alter table users add column n_projects_joined integer not null default 0;
+alter table projects add column document text;
+alter table projects add column n_participants integer not null default 0;
+
+update users set
+    n_projects_created = (select count(*) from user_organized_projects
+                          where id_user = users.id),
+    n_projects_joined = (select count(*) from user_joined_projects
+                         where id_user = users.id);
+update projects set
+    n_participants = (select count(*) from user_joined_projects
+                      where id_project = projects.id);
+
+create index users_by_projects_created on users (n_projects_created desc, id);
+create index users_by_projects_joined on users (n_projects_joined desc, id);
+create index projects_by_participants on projects (n_participants desc, id);
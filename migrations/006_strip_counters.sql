@@ -0,0 +1,9 @@
+-- Leave out of the documents the counters that are 0, as with the other
+-- empty fields (see strip() in backend.py).
+
+update users set document = json_remove(document, '$.n_projects_created')
+    where document is not null and n_projects_created = 0;
+update users set document = json_remove(document, '$.n_projects_joined')
+    where document is not null and n_projects_joined = 0;
+update projects set document = json_remove(document, '$.n_participants')
+    where document is not null and n_participants = 0;
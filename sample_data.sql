@@ -1,6 +1,6 @@
 -- Run this file to add sample values into the database.
 
-insert into users values
+insert into users (id, username, name, password, permissions, email, web) values
     (1, 'user1', 'Johnny B. Goode',
      'pbkdf2:sha256:50000$713rFBmU$1e10a0e9b5fca0b4550b39dffd01931d8cdc64760d5995856e9c775e94e983dd',
      'rxwrxwrxw', 'johnny@ucm.es', 'https://example1.org'),
@@ -28,7 +28,7 @@ insert into user_profiles values  -- id_user, id_profile
     (2, 1), (2, 4),
     (3, 2), (3, 3), (3, 4);
 
-insert into projects values
+insert into projects (id, organizer, name, summary, description, needs, url, img_bg, img1, img2) values
     (1, 1, 'Superproject', 'A new and shiny project', 'This project does blah blah.', 'We need...',
     'https://project1.org', 'img_bg', 'img1.png', 'img2.png'),
     (2, 1, 'Project Meh', 'A new but crappy project', 'This project does not much.', 'We need...',
@@ -47,3 +47,14 @@ insert into user_joined_projects values  -- id_user, id_project
 insert into project_requested_profiles values  -- id_project, id_profile
     (1, 1), (1, 2), (1, 3),
     (3, 3), (3, 4);
+
+-- Counters of the relations, as the backend keeps them (and the documents,
+-- which are built when first read).
+update users set
+    n_projects_created = (select count(*) from user_organized_projects
+                          where id_user = users.id),
+    n_projects_joined = (select count(*) from user_joined_projects
+                         where id_user = users.id);
+update projects set
+    n_participants = (select count(*) from user_joined_projects
+                      where id_project = projects.id);
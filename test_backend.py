@@ -1,17 +1,21 @@
 """
 Test the functionality of backend.py.
 
-The backend server must be running for the tests to run properly.
+The backend server must be running for the tests to run properly. By
+default they go to http://localhost:5000/, but another url can be given in
+the environment variable SMART_URL.
 
 Run with "pytest-3".
 """
 
+import os
+import re
 from contextlib import contextmanager
 import urllib.request as req
 import urllib.error
 import json
 
-urlbase = 'http://localhost:5000/'
+urlbase = os.environ.get('SMART_URL', 'http://localhost:5000/')
 
 
 # Helper functions.
@@ -117,7 +121,7 @@ def test_not_found():
         req.urlopen(url)
         raise Exception('We should not have found that url: %s' % url)
     except urllib.error.HTTPError as e:
-        assert (e.getcode(), e.msg) == (404, 'NOT FOUND')
+        assert (e.getcode(), e.msg.upper()) == (404, 'NOT FOUND')
 
 
 def test_unauthorized():
@@ -126,7 +130,7 @@ def test_unauthorized():
         req.urlopen(req.Request(url, method='DELETE'))
         raise Exception('We should not have access to that url: %s' % url)
     except urllib.error.HTTPError as e:
-        assert (e.getcode(), e.msg) == (401, 'UNAUTHORIZED')
+        assert (e.getcode(), e.msg.upper()) == (401, 'UNAUTHORIZED')
 
 
 def test_auth_basic():
@@ -148,6 +152,46 @@ def test_auth_bearer():
     # If we are not authenticated, those requests will raise an error.
 
 
+def test_token():
+    def get_info(token):
+        r = req.Request(urlbase + 'info',
+                        headers={'Authorization': 'Bearer ' + token})
+        return json.loads(req.urlopen(r).read().decode('utf8'))
+
+    data = jdumps({'usernameOrEmail': 'user1', 'password': 'abc'})
+    token = post('login', data=data)['token']
+    assert get_info(token)['id'] == 1
+
+    uid, rest = token.split('.', 1)
+    for bad_token in ['2.' + rest, token[:-1], token[:-1] + '\xe9',
+                      'garbage']:
+        try:
+            get_info(bad_token)
+            raise Exception('We should not have accepted the token %s' %
+                            bad_token)
+        except urllib.error.HTTPError as e:
+            assert e.code == 401
+
+
+def test_password_checks_are_limited():
+    def login(password):
+        data = jdumps({'usernameOrEmail': 'test_user', 'password': password})
+        try:
+            post('login', data=data)
+            return 200, None
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers['Retry-After']
+
+    with test_user():
+        codes = [login('wrong') for i in range(15)]
+        assert (401, None) in codes
+        code, retry_after = codes[-1]
+        assert code == 429 and int(retry_after) > 0
+        assert login('booo')[0] == 429  # even with the right password
+
+        assert get('users/1')['id'] == 1  # the rest is not limited
+
+
 def test_get_users():
     res = get('users')
     assert type(res) == list
@@ -165,6 +209,124 @@ def test_get_projects():
     assert res[0]['organizer'] == 1
 
 
+def test_lists_match_single_gets():
+    users = get('users')
+    assert users == [get('users/%d' % x['id']) for x in users]
+
+    projects = get('projects')
+    assert projects == [get('projects/%d' % x['id']) for x in projects]
+
+
+def test_pagination():
+    users = get('users')
+    assert get('users?limit=1') == users[:1]
+    assert get('users?limit=2&after=%d' % users[0]['id']) == users[1:3]
+    assert get('users?after=%d' % users[-1]['id']) == []
+
+
+def test_ndjson():
+    def get_lines(path):
+        headers = {'Accept': 'application/x-ndjson'}
+        res = req.urlopen(req.Request(urlbase + path, headers=headers))
+        assert res.headers['Content-Type'] == 'application/x-ndjson'
+        return [json.loads(x) for x in res.read().decode('utf8').splitlines()]
+
+    for table in ['users', 'projects']:
+        docs = get(table)
+        assert get_lines(table) == docs
+        after = docs[0]['id']
+        assert get_lines('%s?limit=2&after=%d' % (table, after)) == docs[1:3]
+        assert get_lines('%s?fields=name&limit=1' % table) == [
+            {'name': docs[0]['name']}]
+
+
+def test_fields_and_filters():
+    res = get('projects?fields=id,name')
+    assert all(set(x) <= {'id', 'name'} for x in res)
+
+    res = get('projects?organizer=1&fields=organizer')
+    assert res and all(x == {'organizer': 1} for x in res)
+
+    res = get('users?profile=programmer&fields=profiles')
+    assert res and all('programmer' in x['profiles'] for x in res)
+
+    try:
+        get('users?fields=password')
+        raise Exception('We should not be able to select the password.')
+    except urllib.error.HTTPError as e:
+        assert e.code == 400
+
+
+def test_counters_and_sort():
+    for table, counter, field in [('projects', 'n_participants',
+                                   'participants'),
+                                  ('users', 'n_projects_joined',
+                                   'projects_joined')]:
+        docs = get(table)
+        assert all(x.get(counter, 0) == len(x.get(field, [])) for x in docs)
+
+        sort = field if table == 'projects' else 'projects_joined'
+        res = get('%s?sort=%s&limit=100' % (table, sort))
+        assert [x['id'] for x in res] == [x['id'] for x in sorted(
+            docs, key=lambda x: (-x.get(counter, 0), x['id']))]
+        assert get('%s?sort=%s&limit=2&after=%d' %
+                   (table, sort, res[0]['id'])) == res[1:3]
+
+    with test_project():
+        pid = get('id/projects/test_project')['id']
+        put('projects/%s' % pid, data=jdumps({'addParticipants': [2, 3]}))
+        assert get('projects/%d' % pid)['n_participants'] == 2
+        res = get('projects?sort=participants&limit=100')
+        counts = [x.get('n_participants', 0) for x in res]
+        assert counts == sorted(counts, reverse=True)
+        assert pid in [x['id'] for x in res if x['n_participants'] == 2]
+
+
+def test_search():
+    with test_project({'summary': 'Ñandú watching'}):
+        pid = get('id/projects/test_project')['id']
+        res = get('search?q=nandu')  # without the diacritics
+        assert [x['id'] for x in res['projects']] == [pid]
+
+        put('projects/%d' % pid, data=jdumps({'summary': 'Other things'}))
+        assert get('search?q=nandu&type=projects') == {'projects': []}
+        assert get('search?q=thin&type=projects')['projects'][0]['id'] == pid
+
+    assert get('search?q=nandu') == {'users': [], 'projects': []}
+    assert get('search?q=user1&type=users')['users'][0]['id'] == 1
+
+    for args in ['q=', 'q=x&type=other', 'q=x&limit=0', 'q=x&other=1']:
+        try:
+            get('search?' + args)
+            raise Exception('We should not have accepted: %s' % args)
+        except urllib.error.HTTPError as e:
+            assert e.code == 400
+
+
+def test_matches():
+    with test_user():
+        uid = get('id/users/test_user')['id']
+        with test_project({'addProfiles': ['painter', 'magician']}):
+            pid = get('id/projects/test_project')['id']
+            assert uid not in [x['id'] for x in
+                               get('projects/%d/candidates' % pid)]
+
+            put('projects/%d' % pid, data=jdumps({'addProfiles':
+                ['programmer', 'drawing artist', 'musician']}))
+            candidates = get('projects/%d/candidates' % pid)
+            matches = [x['matches'] for x in candidates]
+            assert matches == sorted(matches, reverse=True)
+            assert candidates[0]['matches'] == 3  # user3 has 3 of them
+            assert 1 not in [x['id'] for x in candidates]  # the organizer
+
+            suggested = get('users/3/suggested-projects?fields=name&limit=1')
+            assert suggested == [{'name': 'test_project', 'matches': 3}]
+
+            put('projects/%d' % pid, data=jdumps({'addParticipants': [3]}))
+            assert 3 not in [x['id'] for x in
+                             get('projects/%d/candidates' % pid)]
+
+
 def test_add_del_user():
     res = add_test_user()
     assert res['message'] == 'ok'
@@ -227,10 +389,207 @@ def test_add_del_participants():
             assert res['message'] == 'ok'
 
 
+def test_failed_change_is_not_applied():
+    with test_user():
+        uid = get('id/users/test_user')['id']
+        with test_project():
+            pid = get('id/projects/test_project')['id']
+            try:
+                put('projects/%s' % pid, data=jdumps({
+                    'addParticipants': [uid],
+                    'addProfiles': ['nonexistent profile']}))
+                raise Exception('We should not be able to add that profile.')
+            except urllib.error.HTTPError as e:
+                assert e.code == 400
+
+            assert 'participants' not in get('projects/%s' % pid)
+
+
+def test_cached_user_sees_joined_project():
+    with test_user():
+        uid = get('id/users/test_user')['id']
+        with test_project():
+            pid = get('id/projects/test_project')['id']
+            assert 'projects_joined' not in get('users/%s' % uid)
+
+            put('projects/%s' % pid, data=jdumps({'addParticipants': [uid]}))
+            assert get('users/%s' % uid)['projects_joined'] == [pid]
+
+            put('projects/%s' % pid, data=jdumps({'delParticipants': [uid]}))
+            assert 'projects_joined' not in get('users/%s' % uid)
+
+
+def test_etag():
+    def get_status_and_etag(path, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            res = req.urlopen(req.Request(urlbase + path, headers=headers))
+            return res.getcode(), res.headers['ETag']
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers['ETag']
+
+    with test_project():
+        path = 'projects/%s' % get('id/projects/test_project')['id']
+        code, etag = get_status_and_etag(path)
+        assert code == 200 and etag
+        assert get_status_and_etag(path, etag) == (304, etag)
+
+        code, etag_all = get_status_and_etag('projects')
+        assert get_status_and_etag('projects', etag_all) == (304, etag_all)
+
+        res = req.urlopen(req.Request(urlbase + 'projects', headers={
+            'Accept': 'application/x-ndjson', 'If-None-Match': etag_all}))
+        assert res.getcode() == 200 and res.headers['ETag'] != etag_all
+        assert 'Accept' in res.headers['Vary']
+
+        put(path, data=jdumps({'summary': 'changed'}))
+
+        code, etag_new = get_status_and_etag(path, etag)
+        assert code == 200 and etag_new != etag
+        assert get_status_and_etag('projects', etag_all)[0] == 200
+
+        # Right after a change, there is no Last-Modified to send back.
+        assert 'Last-Modified' not in req.urlopen(urlbase + path).headers
+
+
+def test_anonymous_lists():
+    def get_anonymous(path):
+        res = req.urlopen(urlbase + path)
+        return json.loads(res.read().decode('utf8')), res.headers
+
+    for table in ['users', 'projects']:
+        docs, headers = get_anonymous(table)
+        assert docs == get(table) and headers['ETag']
+
+        res = get_anonymous('%s?limit=100' % table)[0]  # maybe a snapshot page
+        assert res == docs[:100]
+
+    with test_user():  # the snapshot changes, or it is not used meanwhile
+        users = get_anonymous('users')[0]
+        assert users == get('users')
+        assert any(x['username'] == 'test_user' for x in users)
+
+    assert not any(x['username'] == 'test_user'
+                   for x in get_anonymous('users')[0])
+
+
+def test_changes():
+    version = get('changes')['version']
+
+    with test_project():
+        pid = get('id/projects/test_project')['id']
+        put('projects/%s' % pid, data=jdumps({'summary': 'changed'}))
+
+        res = get('changes?after=%d' % version)
+        assert res['version'] > version
+        changes = [x for event in res['events'] for x in event['changes']
+                   if x['table'] == 'projects' and x['id'] == pid]
+        assert changes and changes[-1]['document']['summary'] == 'changed'
+
+        # The same, as server-sent events after the Last-Event-ID.
+        headers = {'Accept': 'text/event-stream',
+                   'Last-Event-ID': str(version)}
+        with req.urlopen(req.Request(urlbase + 'changes',
+                                     headers=headers)) as res_sse:
+            assert res_sse.headers['Content-Type'].startswith(
+                'text/event-stream')
+            lines = [res_sse.readline().decode('utf8').strip()
+                     for i in range(4)]
+        assert lines[0].startswith('retry: ') and lines[1] == ''
+        assert lines[2] == 'id: %d' % (version + 1)
+        assert json.loads(lines[3][len('data: '):])['version'] == version + 1
+
+    res = get('changes?after=%d' % version)
+    changes = [x for event in res['events'] for x in event['changes']
+               if x['table'] == 'projects' and x['id'] == pid]
+    assert changes[-1]['document'] is None  # deleted
+
+    assert get('changes?after=%d' % (res['version'] + 1)).get('reset')
+
+
+def test_batch_users():
+    users = [{'username': 'test_batch_%d' % i, 'password': 'booo',
+              'email': 'test_batch_%d@ucm.es' % i} for i in range(5)]
+    users.append(users[0])  # repeated, so it should fail
+    res = post('users:batch', data=jdumps(users))
+    assert [x['message'] for x in res['results']] == ['ok'] * 5 + [
+        "Error: email 'test_batch_0@ucm.es' already exists"]
+
+    uids = [x['id'] for x in res['results'][:5]]
+    assert [get('id/users/test_batch_%d' % i)['id'] for i in range(5)] == uids
+
+    res = put('users:batch', data=jdumps([{'id': uid, 'name': 'Batchman'}
+                                          for uid in uids]))
+    assert all(x['message'] == 'ok' for x in res['results'])
+    assert all(get('users/%d' % uid)['name'] == 'Batchman' for uid in uids)
+
+    res = delete('users:batch', data=jdumps(uids + [uids[0]]))
+    assert [x['message'] for x in res['results']] == ['ok'] * 5 + [
+        'Error: unknown user id %d' % uids[0]]
+
+
+def test_batch_projects():
+    with test_user():
+        uid = get('id/users/test_user')['id']
+        projects = [{'name': 'test_batch_%d' % i, 'summary': 'Summary.',
+                     'needs': 'Nothing.', 'description': 'Empty.'}
+                    for i in range(3)]
+        res = post('projects:batch', data=jdumps(projects))
+        pids = [x['id'] for x in res['results']]
+
+        res = put('projects:batch', data=jdumps([
+            {'id': pids[0], 'addParticipants': [uid]},
+            {'id': pids[1], 'addProfiles': ['nonexistent profile']}]))
+        assert res['results'][0]['message'] == 'ok'
+        assert res['results'][1]['message'].startswith('Error')
+        assert get('projects/%d' % pids[0])['participants'] == [uid]
+
+        res = delete('projects:batch', data=jdumps(pids))
+        assert all(x['message'] == 'ok' for x in res['results'])
+
+
 def test_get_info():
     assert get('info') == get('users/1')
 
 
+def test_get_stats():
+    pools = get('stats')['pool']
+    keys = 'size checked_in checked_out overflow'.split()
+    assert all(x in pools[name] for x in keys for name in ['read', 'write'])
+    assert pools['read']['checked_out'] >= 1  # the one used by this request
+
+    with test_user():  # not the administrator, so no sql statements
+        token = post('login', data=jdumps({'usernameOrEmail': 'test_user',
+                                           'password': 'booo'}))['token']
+        r = req.Request(urlbase + 'stats',
+                        headers={'Authorization': 'Bearer ' + token})
+        stats = json.loads(req.urlopen(r).read().decode('utf8'))
+        assert 'cache' in stats and 'slowest_queries' not in stats
+
+
+def test_server_timing():
+    res = req.urlopen(urlbase + 'users/1')
+    timing = res.headers['Server-Timing']
+    assert re.fullmatch(r'db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+',
+                        timing)
+
+
+def test_metrics():
+    get('users/1')
+
+    mgr = req.HTTPPasswordMgrWithDefaultRealm()
+    mgr.add_password(None, urlbase, 'user1', 'abc')
+    opener = req.build_opener(req.HTTPBasicAuthHandler(mgr))
+    text = opener.open(urlbase + 'metrics').read().decode('utf8')
+
+    labels = 'method="GET",route="/users/<int:user_id>"'
+    for name in ['smart_request_duration_seconds', 'smart_request_db_seconds',
+                 'smart_request_queries']:
+        assert '# TYPE %s histogram' % name in text
+        assert '%s_count{%s}' % (name, labels) in text
+        assert '%s_bucket{%s,le="+Inf"}' % (name, labels) in text
+
+
 def test_existing_user():
     with test_user():
         try:
@@ -287,6 +646,27 @@ def test_change_password():
         # If we are not authenticated, that request will raise an error.
 
 
+def test_old_password_rejected():
+    def get_info(password):
+        mgr = req.HTTPPasswordMgrWithDefaultRealm()
+        mgr.add_password(None, urlbase, 'test_user', password)
+        opener = req.build_opener(req.HTTPBasicAuthHandler(mgr))
+        return json.loads(opener.open(urlbase + 'info').read().decode('utf8'))
+
+    with test_user():
+        uid = get('id/users/test_user')['id']
+        assert get_info('booo')['id'] == uid  # now those credentials are known
+
+        put('users/%s' % uid, data=jdumps({'password': 'changed'}))
+
+        assert get_info('changed')['id'] == uid
+        try:
+            get_info('booo')
+            raise Exception('We should not be able to use the old password.')
+        except urllib.error.HTTPError as e:
+            assert e.code == 401
+
+
 def test_add_del_profiles():
     profiles = ['programmer', 'magician']
     with test_project():